@@ -1,42 +1,90 @@
 import argparse
+import collections
+import copy
 import json
+import math
 import datetime
-import timeit
+import random
 import requests
+import requests.adapters
+import threading
 import time
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from aconitum.query import AbstractBenchmarkQueryRunnable, AbstractBenchmarkQuerySuite
 from aconitum.executor import AbstractBenchmarkRunnable
 
 
 class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
-    def __init__(self, nc_uri, logger, **kwargs):
+    def __init__(self, nc_uri, session, logger, **kwargs):
         super().__init__(logger=logger, **kwargs)
         self.query_prefix = kwargs['query_prefix']
         self.join_hint = kwargs['join_hint']
+        self.connect_timeout = kwargs['connect_timeout']
+        self.max_query_attempts = kwargs['max_query_attempts']
         self.nc_uri = nc_uri
+        self.session = session
         self.logger = logger
 
-    def execute_sqlpp(self, statement, timeout=None):
-        lean_statement = ' '.join(statement.split())
-        query_parameters = {'statement': lean_statement}
+        # Successful responses are (optionally) kept in a small LRU cache, keyed by their statement.
+        self.response_cache_size = kwargs['response_cache_size']
+        self.response_cache = collections.OrderedDict()
+        self.response_cache_lock = threading.Lock()
 
-        # Retry the query until success.
+    def prepare_sqlpp(self, statement):
+        """ Collapse the whitespace of a statement and fill in everything except its v0 and v1 parameters. """
+        return ' '.join(statement.format(
+            query_prefix=self.query_prefix.replace('{', '{{').replace('}', '}}'),
+            join_hint=self.join_hint.replace('{', '{{').replace('}', '}}'),
+            v0='{v0}',
+            v1='{v1}'
+        ).split())
+
+    def execute_sqlpp(self, statement, timeout=None):
+        query_parameters = {'statement': statement}
+        if self.response_cache_size > 0:
+            with self.response_cache_lock:
+                cached_response = self.response_cache.get(statement)
+                if cached_response is not None:
+                    self.response_cache.move_to_end(statement)
+            if cached_response is not None:
+                self.logger.debug('Serving query "%s" from the response cache.', statement)
+                return {**copy.deepcopy(cached_response), 'responseCached': True}
+
+        # Retry the query until the cluster answers (or up to N times, if given). Back off exponentially (with jitter)
+        # between attempts, up to a minute.
+        attempt = 0
         while True:
             try:
-                self.logger.debug(f'Issuing query "{lean_statement}" to cluster.')
-                t_before = timeit.default_timer()
-                response_json = requests.post(self.nc_uri, query_parameters, timeout=timeout).json()
-                response_json['clientTime'] = timeit.default_timer() - t_before
-                break
+                self.logger.debug('Issuing query "%s" to cluster.', statement)
+                response = self.session.post(self.nc_uri, query_parameters, timeout=(self.connect_timeout, timeout))
             except requests.exceptions.RequestException as e:
                 if timeout is not None and isinstance(e, requests.exceptions.ReadTimeout):
                     self.logger.warning(f'Statement {statement} has run longer than the specified timeout {timeout}.')
                     response_json = {'status': f'Timeout. Exception: {str(e)}'}
                     break
+                elif self.max_query_attempts is not None and attempt + 1 >= self.max_query_attempts:
+                    # An unreachable cluster is not a failure of this query, so we abort instead of excluding it.
+                    self.logger.error(f'Exception caught: {str(e)}. Giving up after {attempt + 1} attempts.')
+                    raise
                 else:
-                    self.logger.warning(f'Exception caught: {str(e)}. Restarting the query in 5 seconds...')
-                    time.sleep(5)
+                    delay = min(60.0, 0.5 * 2 ** min(attempt, 7) + random.random())
+                    self.logger.warning(f'Exception caught: {str(e)}. Restarting the query in {delay:.1f} seconds...')
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+
+            # The cluster has answered. A response that is not JSON (e.g. an error page) is still the result of
+            # this query, so we do not retry it.
+            try:
+                response_json = response.json() if orjson is None else orjson.loads(response.content)
+            except ValueError as e:
+                response_json = {'status': f'Invalid response (HTTP {response.status_code}). Exception: {str(e)}'}
+            break
 
         if response_json['status'] != 'success':
             self.logger.warning(f'Status of executing statement {statement} not successful, '
@@ -44,7 +92,12 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             self.logger.warning(f'JSON dump: {response_json}')
 
         # Add the query to response.
-        response_json['statement'] = lean_statement
+        response_json['statement'] = statement
+        if self.response_cache_size > 0 and response_json['status'] == 'success':
+            with self.response_cache_lock:
+                self.response_cache[statement] = copy.deepcopy(response_json)
+                if len(self.response_cache) > self.response_cache_size:
+                    self.response_cache.popitem(last=False)
         return response_json
 
     def query_a_factory(self) -> AbstractBenchmarkQueryRunnable:
@@ -52,14 +105,15 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_QueryARunnable, self).__init__('A', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     FROM       Orders O, O.o_orderline OL
                     WHERE      OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
                     SELECT     COUNT(*);
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _QueryARunnable(query_suite=self)
 
@@ -68,15 +122,16 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_QueryBRunnable, self).__init__('B', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     FROM       Orders O
                     WHERE      SOME OL IN O.o_orderline 
                                SATISFIES  OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
                     SELECT     COUNT(*) AS count_order;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _QueryBRunnable(query_suite=self)
 
@@ -85,15 +140,16 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_QueryCRunnable, self).__init__('C', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     FROM       Orders O
                     WHERE      SOME AND EVERY OL IN O.o_orderline 
                                SATISFIES OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
                     SELECT     COUNT(*) AS count_order;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _QueryCRunnable(query_suite=self)
 
@@ -102,15 +158,16 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_QueryDRunnable, self).__init__('D', query_suite.generate_items)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     FROM       Item I, Orders O, O.o_orderline OL
                     WHERE      I.i_id BETWEEN {v0} AND {v1} AND 
-                               TO_BIGINT(I.i_id) {self.query_suite.join_hint} = OL.ol_i_id
+                               TO_BIGINT(I.i_id) {join_hint} = OL.ol_i_id
                     SELECT     COUNT(*) AS count_order_item;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _QueryDRunnable(query_suite=self)
 
@@ -119,10 +176,8 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query1Runnable, self).__init__('1', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     FROM        Orders O, O.o_orderline OL
                     WHERE       OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
                     GROUP BY    OL.ol_number
@@ -130,7 +185,10 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                 AVG(OL.ol_quantity) AS avg_qty, AVG(OL.ol_amount) AS avg_amount, 
                                 COUNT(*) AS count_order
                     ORDER BY    OL.ol_number;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query1Runnable(query_suite=self)
 
@@ -139,15 +197,16 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query6Runnable, self).__init__('6', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     FROM    Orders O, O.o_orderline OL
                     WHERE   OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}' AND 
                             OL.ol_quantity BETWEEN 1 AND 100000
                     SELECT  SUM(OL.ol_amount) AS revenue;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query6Runnable(query_suite=self)
 
@@ -156,21 +215,19 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query7Runnable, self).__init__('7', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}        
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}        
                     FROM        Orders O, O.o_orderline OL, Stock S, Customer C, Supplier SU, Nation N1, Nation N2
                     LET         s_suppkey = ((S.s_w_id * S.s_i_id) % 10000), 
                                 c_nationkey = STRING_TO_CODEPOINT(SUBSTR(C.c_state, 1, 1))[0]
-                    WHERE       S.s_w_id {self.query_suite.join_hint} = TO_BIGINT(OL.ol_supply_w_id) AND
-                                S.s_i_id {self.query_suite.join_hint} = TO_BIGINT(OL.ol_i_id) AND
-                                C.c_id {self.query_suite.join_hint} = TO_BIGINT(O.o_c_id) AND
-                                C.c_w_id {self.query_suite.join_hint} = TO_BIGINT(O.o_w_id) AND
-                                C.c_d_id {self.query_suite.join_hint} = TO_BIGINT(O.o_d_id) AND
-                                SU.su_suppkey {self.query_suite.join_hint} = TO_BIGINT(s_suppkey) AND
-                                N1.n_nationkey {self.query_suite.join_hint} = TO_BIGINT(SU.su_nationkey) AND
-                                N2.n_nationkey {self.query_suite.join_hint} = TO_BIGINT(c_nationkey) AND
+                    WHERE       S.s_w_id {join_hint} = TO_BIGINT(OL.ol_supply_w_id) AND
+                                S.s_i_id {join_hint} = TO_BIGINT(OL.ol_i_id) AND
+                                C.c_id {join_hint} = TO_BIGINT(O.o_c_id) AND
+                                C.c_w_id {join_hint} = TO_BIGINT(O.o_w_id) AND
+                                C.c_d_id {join_hint} = TO_BIGINT(O.o_d_id) AND
+                                SU.su_suppkey {join_hint} = TO_BIGINT(s_suppkey) AND
+                                N1.n_nationkey {join_hint} = TO_BIGINT(SU.su_nationkey) AND
+                                N2.n_nationkey {join_hint} = TO_BIGINT(c_nationkey) AND
                                 ( ( N1.n_name = 'Germany' AND N2.n_name = 'Cambodia' ) OR
                                   ( N1.n_name = 'Cambodia' AND N2.n_name = 'Germany' ) ) AND
                                 OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
@@ -180,7 +237,10 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                 SUBSTR(O.o_entry_d, 0, 4) AS l_year, 
                                 SUM(OL.ol_amount) AS revenue
                     ORDER BY    SU.su_nationkey, cust_nation, l_year;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query7Runnable(query_suite=self)
 
@@ -189,10 +249,8 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query12Runnable, self).__init__('12', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     FROM        Orders O, O.o_orderline OL
                     WHERE       O.o_entry_d <= OL.ol_delivery_d AND 
                                 OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
@@ -203,7 +261,10 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                 SUM(CASE WHEN O.o_carrier_id <> 1 OR O.o_carrier_id <> 2 
                                          THEN 1 ELSE 0 END) AS low_line_count
                     ORDER BY    O.o_ol_cnt;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query12Runnable(query_suite=self)
 
@@ -212,16 +273,17 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query14Runnable, self).__init__('14', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     FROM    Orders O, O.o_orderline OL, Item I
                     WHERE   OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}' AND 
-                            I.i_id {self.query_suite.join_hint} = TO_BIGINT(OL.ol_i_id) 
+                            I.i_id {join_hint} = TO_BIGINT(OL.ol_i_id) 
                     SELECT  100.00 * SUM(CASE WHEN I.i_data LIKE 'pr%' THEN OL.ol_amount ELSE 0 END) / 
                                 (1 + SUM(OL.ol_amount)) AS promo_revenue;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query14Runnable(query_suite=self)
 
@@ -230,29 +292,30 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query15Runnable, self).__init__('15', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     WITH        Revenue AS (
                                 FROM        Orders O, O.o_orderline OL, Stock S
                                 LET         supplier_no = ((S.s_w_id * S.s_i_id) % 10000)
-                                WHERE       S.s_i_id {self.query_suite.join_hint} = TO_BIGINT(OL.ol_i_id) AND 
-                                            S.s_w_id {self.query_suite.join_hint} = TO_BIGINT(OL.ol_supply_w_id) AND
+                                WHERE       S.s_i_id {join_hint} = TO_BIGINT(OL.ol_i_id) AND 
+                                            S.s_w_id {join_hint} = TO_BIGINT(OL.ol_supply_w_id) AND
                                             OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
                                 GROUP BY    supplier_no
                                 SELECT      supplier_no,
                                             SUM(OL.ol_amount) AS total_revenue
                     )
                     FROM        Revenue R, Supplier SU
-                    WHERE       SU.su_suppkey {self.query_suite.join_hint} = TO_BIGINT(R.supplier_no) AND 
+                    WHERE       SU.su_suppkey {join_hint} = TO_BIGINT(R.supplier_no) AND 
                                 R.total_revenue = ( 
                                     FROM    Revenue    
                                     SELECT  VALUE MAX(total_revenue) 
                                 )[0]
                     SELECT      SU.su_suppkey, SU.su_name, SU.su_address, SU.su_phone, R.total_revenue
                     ORDER BY    SU.su_suppkey;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query15Runnable(query_suite=self)
 
@@ -261,14 +324,12 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query20Runnable, self).__init__('20', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_sqlpp(f"""
-                    {self.query_suite.query_prefix}
+                self.template = query_suite.prepare_sqlpp("""
+                    {query_prefix}
                     WITH        SupplierKeys AS (
                                 FROM        Orders O, O.o_orderline OL, Stock S, Item I
                                 WHERE       OL.ol_i_id = S.s_i_id AND
-                                            I.i_id {self.query_suite.join_hint} = TO_BIGINT(S.s_i_id) AND
+                                            I.i_id {join_hint} = TO_BIGINT(S.s_i_id) AND
                                             I.i_data LIKE 'co%' AND 
                                             OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
                                 GROUP BY    S.s_i_id, S.s_w_id, S.s_quantity
@@ -276,12 +337,15 @@ class AsterixDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                 SELECT      VALUE ((S.s_w_id * S.s_i_id) % 10000)
                     )
                     FROM        SupplierKeys SK, Supplier SU, Nation N
-                    WHERE       SU.su_suppkey {self.query_suite.join_hint} = TO_BIGINT(SK) AND
-                                N.n_nationkey {self.query_suite.join_hint} = TO_BIGINT(SU.su_nationkey) AND 
+                    WHERE       SU.su_suppkey {join_hint} = TO_BIGINT(SK) AND
+                                N.n_nationkey {join_hint} = TO_BIGINT(SU.su_nationkey) AND 
                                 N.n_name = 'Germany'
                     SELECT      SU.su_name, SU.su_address
                     ORDER BY    SU.su_name;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_sqlpp(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query20Runnable(query_suite=self)
 
@@ -318,39 +382,67 @@ class AsterixDBBenchmarkRunnable(AbstractBenchmarkRunnable):
         self.nc_uri = self.config['clusterController']['address'] + ':' + \
                       str(self.config['clusterController']['port'])
         self.nc_uri = 'http://' + self.nc_uri + '/query/service'
-        self.exclude_set = set()
 
-    def perform_benchmark(self):
+        # Keep our connections to the cluster alive across queries. Retries are handled by our query suite.
+        pool_size = max(self.config['connectionPoolSize'], self.config['concurrency'])
+        self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
+        self.session.mount('http://', requests.adapters.HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=0
+        ))
+
+        # Our query runnables do not depend on sigma, so we only need to build them (and their names) once.
+        self.queries = [(query, str(query)) for query in AsterixDBBenchmarkQuerySuite(
+            query_prefix=self.config['queryPrefix'],
+            join_hint=self.config['joinHint'],
+            connect_timeout=self.config['connectTimeout'],
+            max_query_attempts=self.config['maxQueryAttempts'],
+            response_cache_size=self.config['responseCacheSize'],
+            nc_uri=self.nc_uri,
+            session=self.session,
+            logger=self.logger,
+            sigma_values=self.config['experiment']['sigmaValues'],
+            **self.config['tpcCH']
+        )]
+
+    def _perform_benchmark_serial(self):
         for i in range(self.config['experiment']['repeat']):
             for sigma in self.config['experiment']['sigmaValues']:
-                for query in AsterixDBBenchmarkQuerySuite(
-                    query_prefix=self.config['queryPrefix'],
-                    join_hint=self.config['joinHint'],
-                    nc_uri=self.nc_uri,
-                    logger=self.logger,
-                    **self.config['tpcCH']
-                ):
-                    # Check if these current parameters exist in the exclude set.
-                    if (sigma, str(query),) in self.exclude_set:
+                for query, query_name in self.queries:
+                    # Check if this query has already failed at this sigma (or at a smaller sigma).
+                    if sigma >= self.min_excluded_sigma.get(query_name, math.inf):
                         continue
 
                     # Execute the query. Record the client response time.
-                    self.logger.info(f'Executing query {query} with sigma {sigma} @ run {i + 1}.')
-                    t_before = timeit.default_timer()
+                    self.logger.info(f'Executing query {query_name} with sigma {sigma} @ run {i + 1}.')
+                    t_before = time.perf_counter_ns()
                     results = query(sigma=sigma, timeout=self.config['experiment']['timeout'])
-                    results['clientTime'] = timeit.default_timer() - t_before
+                    results['clientTime'] = (time.perf_counter_ns() - t_before) * 1e-9
                     results['runNumber'] = i
                     self.log_results(results)
 
-                    # If this query was not successful, add the query + parameter to the exclude set.
+                    # If this query was not successful, exclude this query for all sigma >= this sigma.
                     if results['status'] != 'success':
                         self.logger.warning('Query was not successful. No longer running (>= sigma) + query.')
-                        for excluded_sigma in self.config['experiment']['sigmaValues']:
-                            if excluded_sigma >= sigma:
-                                self.exclude_set.add((excluded_sigma, str(query),))
+                        self.min_excluded_sigma[query_name] = \
+                            min(sigma, self.min_excluded_sigma.get(query_name, math.inf))
                         self.logger.info('Restarting the AsterixDB instance.')
                         self.call_subprocess(self.config['restartCommand'])
 
+    def perform_benchmark(self):
+        # By default, we execute each query in isolation. Otherwise, overlap up to N queries at a time.
+        if self.config['concurrency'] > 1:
+            self.logger.info(f'Executing up to {self.config["concurrency"]} queries concurrently.')
+            self.perform_benchmark_concurrent()
+        else:
+            self._perform_benchmark_serial()
+
+    def perform_post(self):
+        self.logger.info('Closing the AsterixDB session.')
+        self.session.close()
+
 
 if __name__ == '__main__':
     AsterixDBBenchmarkRunnable().invoke()
@@ -1,7 +1,8 @@
 import argparse
 import json
+import math
 import datetime
-import timeit
+import time
 
 from couchbase.auth import PasswordAuthenticator
 from couchbase.cluster import Cluster, ClusterOptions
@@ -17,19 +18,26 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
         self.keyspace_prefix = f'{bucket_name}._default'
         self.logger = logger
 
+    def prepare_n1ql(self, statement):
+        """ Collapse the whitespace of a statement and fill in everything except its v0 and v1 parameters. """
+        return ' '.join(statement.format(
+            keyspace_prefix=self.keyspace_prefix.replace('{', '{{').replace('}', '}}'),
+            v0='{v0}',
+            v1='{v1}'
+        ).split())
+
     def execute_n1ql(self, statement, timeout=None):
         query_parameters = {} if timeout is None else {'timeout': datetime.timedelta(seconds=timeout)}
-        lean_statement = ' '.join(statement.split())
         try:
-            response_iterable = self.cluster.query(lean_statement, **query_parameters)
-            response_json = {'statement': lean_statement, 'results': []}
+            response_iterable = self.cluster.query(statement, **query_parameters)
+            response_json = {'statement': statement, 'results': []}
             response_json = {**response_json, **response_iterable.meta}
             for record in response_iterable:
                 response_json['results'].append(record)
 
         except Exception as e:
             self.logger.warning(f'Status of executing statement {statement} not successful, but instead {e}.')
-            response_json = {'statement': lean_statement, 'results': [], 'error': str(e), 'status': 'timeout'}
+            response_json = {'statement': statement, 'results': [], 'error': str(e), 'status': 'timeout'}
 
         return response_json
 
@@ -38,14 +46,15 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_QueryARunnable, self).__init__('A', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM        {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM        {keyspace_prefix}.Orders O
                     UNNEST      O.o_orderline OL
                     WHERE       OL.ol_delivery_d BETWEEN "{v0}" AND "{v1}"
                     SELECT      COUNT(*) AS count_order;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _QueryARunnable(query_suite=self)
 
@@ -54,15 +63,16 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_QueryBRunnable, self).__init__('B', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM        {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM        {keyspace_prefix}.Orders O
                     WHERE       SOME OL IN O.o_orderline
                                 SATISFIES OL.ol_delivery_d BETWEEN "{v0}" AND "{v1}"
                                 END
                     SELECT      COUNT(*) AS count_order;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _QueryBRunnable(query_suite=self)
 
@@ -71,15 +81,16 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_QueryCRunnable, self).__init__('C', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM        {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM        {keyspace_prefix}.Orders O
                     WHERE       SOME AND EVERY OL IN O.o_orderline
                                 SATISFIES OL.ol_delivery_d BETWEEN "{v0}" AND "{v1}"
                                 END
                     SELECT      COUNT(*) AS count_order;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _QueryCRunnable(query_suite=self)
 
@@ -88,16 +99,17 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_QueryDRunnable, self).__init__('D', query_suite.generate_items)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM       {self.query_suite.keyspace_prefix}.Item I
-                    JOIN       {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM       {keyspace_prefix}.Item I
+                    JOIN       {keyspace_prefix}.Orders O
                     ON         ANY OL IN O.o_orderline 
                                SATISFIES OL.ol_i_id = I.i_id END
                     WHERE      I.i_id BETWEEN {v0} AND {v1}
                     SELECT     COUNT(*) AS count_order_item;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _QueryDRunnable(query_suite=self)
 
@@ -106,10 +118,8 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query1Runnable, self).__init__('1', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM        {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM        {keyspace_prefix}.Orders O
                     UNNEST      O.o_orderline OL
                     WHERE       OL.ol_delivery_d BETWEEN "{v0}" AND "{v1}"
                     GROUP BY    OL.ol_number
@@ -117,7 +127,10 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                 AVG(OL.ol_quantity) AS avg_qty, AVG(OL.ol_amount) AS avg_amount, 
                                 COUNT(*) AS count_order
                     ORDER BY    OL.ol_number;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query1Runnable(query_suite=self)
 
@@ -126,15 +139,16 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query6Runnable, self).__init__('6', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM    {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM    {keyspace_prefix}.Orders O
                     UNNEST  O.o_orderline OL
                     WHERE   OL.ol_delivery_d BETWEEN "{v0}" AND "{v1}" AND 
                             OL.ol_quantity BETWEEN 1 AND 100000
                     SELECT  SUM(OL.ol_amount) AS revenue;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query6Runnable(query_suite=self)
 
@@ -143,23 +157,21 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query7Runnable, self).__init__('7', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM        {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM        {keyspace_prefix}.Orders O
                     UNNEST      O.o_orderline OL
-                    JOIN        {self.query_suite.keyspace_prefix}.Stock S
+                    JOIN        {keyspace_prefix}.Stock S
                     ON          OL.ol_supply_w_id = S.s_w_id AND 
                                 OL.ol_i_id = S.s_i_id
-                    JOIN        {self.query_suite.keyspace_prefix}.Customer C
+                    JOIN        {keyspace_prefix}.Customer C
                     ON          C.c_id = O.o_c_id AND 
                                 C.c_w_id = O.o_w_id AND
                                 C.c_d_id = O.o_d_id
-                    JOIN        {self.query_suite.keyspace_prefix}.Supplier SU
+                    JOIN        {keyspace_prefix}.Supplier SU
                     ON          ((S.s_w_id * S.s_i_id) % 10000) = SU.su_suppkey
-                    JOIN        {self.query_suite.keyspace_prefix}.Nation N1
+                    JOIN        {keyspace_prefix}.Nation N1
                     ON          SU.su_nationkey = N1.n_nationkey
-                    JOIN        {self.query_suite.keyspace_prefix}.Nation N2
+                    JOIN        {keyspace_prefix}.Nation N2
                     ON          (stringToCodepoint(SUBSTR(C.c_state, 1, 1)))[0] = N2.n_nationkey
                     LET         c_nationkey = (stringToCodepoint(SUBSTR(C.c_state, 1, 1)))[0]
                     WHERE       OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}' AND
@@ -171,7 +183,10 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                 SUBSTR(O.o_entry_d, 0, 4) AS l_year, 
                                 SUM(O.ol_amount) AS revenue
                     ORDER BY    SU.su_nationkey, cust_nation, l_year;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query7Runnable(query_suite=self)
 
@@ -180,10 +195,8 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query12Runnable, self).__init__('12', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM        {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM        {keyspace_prefix}.Orders O
                     UNNEST      O.o_orderline OL
                     WHERE       O.o_entry_d <= OL.ol_delivery_d AND 
                                 OL.ol_delivery_d BETWEEN "{v0}" AND "{v1}"
@@ -194,7 +207,10 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                 SUM(CASE WHEN O.o_carrier_id <> 1 OR O.o_carrier_id <> 2 
                                          THEN 1 ELSE 0 END) AS low_line_count
                     ORDER BY    O.o_ol_cnt;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query12Runnable(query_suite=self)
 
@@ -203,17 +219,18 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query14Runnable, self).__init__('14', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
-                    FROM    {self.query_suite.keyspace_prefix}.Orders O
+                self.template = query_suite.prepare_n1ql("""
+                    FROM    {keyspace_prefix}.Orders O
                     UNNEST  O.o_orderline OL
-                    JOIN    {self.query_suite.keyspace_prefix}.Item I
+                    JOIN    {keyspace_prefix}.Item I
                     ON      I.i_id = OL.ol_i_id
                     WHERE   OL.ol_delivery_d BETWEEN "{v0}" AND "{v1}"
                     SELECT  100.00 * SUM(CASE WHEN I.i_data LIKE 'pr%' THEN OL.ol_amount ELSE 0 END) / 
                                 (1 + SUM(OL.ol_amount)) AS promo_revenue;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query14Runnable(query_suite=self)
 
@@ -222,13 +239,11 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query15Runnable, self).__init__('15', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
+                self.template = query_suite.prepare_n1ql("""
                     WITH        Revenue AS (
-                                FROM        {self.query_suite.keyspace_prefix}.Orders O
+                                FROM        {keyspace_prefix}.Orders O
                                 UNNEST      O.o_orderline OL
-                                JOIN        {self.query_suite.keyspace_prefix}.Stock S
+                                JOIN        {keyspace_prefix}.Stock S
                                 ON          OL.ol_i_id = S.s_i_id AND OL.ol_supply_w_id = S.s_w_id
                                 WHERE       OL.ol_delivery_d BETWEEN "{v0}" AND "{v1}"
                                 GROUP BY    ((S.s_w_id * S.s_i_id) % 10000)
@@ -236,7 +251,7 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                             SUM(OL.ol_amount) AS total_revenue
                     )
                     FROM        Revenue R
-                    JOIN        {self.query_suite.keyspace_prefix}.Supplier SU
+                    JOIN        {keyspace_prefix}.Supplier SU
                     ON          SU.su_suppkey = R.supplier_no
                     WHERE       R.total_revenue = ( 
                                 FROM        Revenue M
@@ -244,7 +259,10 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                     )[0]
                     SELECT      SU.su_suppkey, SU.su_name, SU.su_address, SU.su_phone, R.total_revenue
                     ORDER BY    SU.su_suppkey;
-                """, timeout=timeout)
+                """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query15Runnable(query_suite=self)
 
@@ -253,16 +271,14 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             def __init__(self, query_suite):
                 super(_Query20Runnable, self).__init__('20', query_suite.generate_dates)
                 self.query_suite = query_suite
-
-            def invoke(self, v0, v1, timeout) -> dict:
-                return self.query_suite.execute_n1ql(f"""
+                self.template = query_suite.prepare_n1ql("""
                     WITH        SupplierKeys AS (
-                                FROM       {self.query_suite.keyspace_prefix}.Orders O
+                                FROM       {keyspace_prefix}.Orders O
                                 UNNEST     O.o_orderline OL
-                                JOIN       {self.query_suite.keyspace_prefix}.Stock S
+                                JOIN       {keyspace_prefix}.Stock S
                                 USE        HASH(BUILD)
                                 ON         OL.ol_i_id = S.s_i_id
-                                JOIN       {self.query_suite.keyspace_prefix}.Item I
+                                JOIN       {keyspace_prefix}.Item I
                                 ON         I.i_id = S.s_i_id
                                 WHERE      I.i_data LIKE 'co%' AND 
                                            OL.ol_delivery_d BETWEEN '{v0}' AND '{v1}'
@@ -271,14 +287,17 @@ class CouchbaseBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                                 SELECT     VALUE ((S.s_w_id * S.s_i_id) % 10000)   
                     )
                     FROM        SupplierKeys SK
-                    JOIN        {self.query_suite.keyspace_prefix}.Supplier SU
+                    JOIN        {keyspace_prefix}.Supplier SU
                     ON          SU.su_suppkey = SK
-                    JOIN        {self.query_suite.keyspace_prefix}.Nation N
+                    JOIN        {keyspace_prefix}.Nation N
                     ON          N.n_nationkey = SU.su_nationkey
                     WHERE       N.n_name = 'Germany'
                     SELECT      SU.su_name, SU.su_address
                     ORDER BY    SU.su_name;
-                  """, timeout=timeout)
+                  """)
+
+            def invoke(self, v0, v1, timeout) -> dict:
+                return self.query_suite.execute_n1ql(self.template.format(v0=v0, v1=v1), timeout=timeout)
 
         return _Query20Runnable(query_suite=self)
 
@@ -318,35 +337,37 @@ class CouchbaseBenchmarkRunnable(AbstractBenchmarkRunnable):
             username=self.config['username'],
             password=self.config['password']
         )))
-        self.exclude_set = set()
+
+        # Our query runnables do not depend on sigma, so we only need to build them (and their names) once.
+        self.queries = [(query, str(query)) for query in CouchbaseBenchmarkQuerySuite(
+            cluster=self.cluster,
+            bucket_name=self.bucket_name,
+            logger=self.logger,
+            sigma_values=self.config['experiment']['sigmaValues'],
+            **self.config['tpcCH']
+        )]
 
     def perform_benchmark(self):
         for i in range(self.config['experiment']['repeat']):
             for sigma in self.config['experiment']['sigmaValues']:
-                for query in CouchbaseBenchmarkQuerySuite(
-                    cluster=self.cluster,
-                    bucket_name=self.bucket_name,
-                    logger=self.logger,
-                    **self.config['tpcCH']
-                ):
-                    # Check if these current parameters exist in the exclude set.
-                    if (sigma, str(query),) in self.exclude_set:
+                for query, query_name in self.queries:
+                    # Check if this query has already failed at this sigma (or at a smaller sigma).
+                    if sigma >= self.min_excluded_sigma.get(query_name, math.inf):
                         continue
 
                     # Execute the query. Record the client response time.
-                    self.logger.info(f'Executing query {query} with sigma {sigma} @ run {i + 1}.')
-                    t_before = timeit.default_timer()
+                    self.logger.info(f'Executing query {query_name} with sigma {sigma} @ run {i + 1}.')
+                    t_before = time.perf_counter_ns()
                     results = query(sigma=sigma, timeout=self.config['experiment']['timeout'])
-                    results['clientTime'] = timeit.default_timer() - t_before
+                    results['clientTime'] = (time.perf_counter_ns() - t_before) * 1e-9
                     results['runNumber'] = i
                     self.log_results(results)
 
-                    # If this query was not successful, add the query + parameter to the exclude set.
+                    # If this query was not successful, exclude this query for all sigma >= this sigma.
                     if results['status'] != 'success':
                         self.logger.warning('Query was not successful. No longer running (>= sigma) + query.')
-                        for excluded_sigma in self.config['experiment']['sigmaValues']:
-                            if excluded_sigma >= sigma:
-                                self.exclude_set.add((excluded_sigma, str(query),))
+                        self.min_excluded_sigma[query_name] = \
+                            min(sigma, self.min_excluded_sigma.get(query_name, math.inf))
                         self.logger.info('Restarting the Couchbase instance.')
                         self.call_subprocess(self.config['restartCommand'])
 
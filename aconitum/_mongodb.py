@@ -1,10 +1,11 @@
 import argparse
 import json
+import math
 import datetime
-import timeit
+import time
 import pymongo
 import urllib.parse
-import bson.json_util
+import bson
 import pymongo.errors
 
 from aconitum.query import AbstractBenchmarkQueryRunnable, AbstractBenchmarkQuerySuite
@@ -12,17 +13,34 @@ from aconitum.executor import AbstractBenchmarkRunnable
 
 
 class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
-    def __init__(self, database_factory, logger, **kwargs):
+    def __init__(self, database, logger, **kwargs):
         super().__init__(logger=logger, **kwargs)
-        self.database_factory = database_factory
+        self.database = database
+        self.batch_size = kwargs['batch_size']
         self.logger = logger
 
-    @staticmethod
-    def _format_strict(result):
-        return json.loads(bson.json_util.dumps(result))
-
-    def execute_select(self, name, count=None, aggregate=None, timeout=None):
-        collection = self.database_factory()[name]
+    @classmethod
+    def _to_jsonable(cls, result):
+        """ Walk a BSON document once, coercing any BSON-specific types into JSON-safe values. """
+        if isinstance(result, dict):
+            return {k: cls._to_jsonable(v) for k, v in result.items()}
+        elif isinstance(result, list):
+            return [cls._to_jsonable(v) for v in result]
+        elif result is None or isinstance(result, (str, int, float)):
+            return result
+        elif isinstance(result, bson.ObjectId):
+            return str(result)
+        elif isinstance(result, datetime.datetime):
+            return result.isoformat()
+        elif isinstance(result, bson.Decimal128):
+            return float(result.to_decimal())
+        else:
+            return str(result)
+
+    def execute_select(self, name, count=None, aggregate=None, timeout=None, allow_disk_use=False, hint=None,
+                       single_result=False):
+        collection = self.database[name]
+        hint_parameters = {} if hint is None else {'hint': hint}
 
         if count is None and aggregate is None:
             raise ValueError("Either predicate or aggregate must be specified.")
@@ -30,23 +48,42 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
         elif count is not None and aggregate is not None:
             raise ValueError("Both predicate and aggregate cannot be specified at the same time.")
 
+        server_time, fetch_time, parse_time = None, None, None
         try:
             if count is not None:
-                t_before = timeit.default_timer()
-                query_results = [{
-                    'order_count': collection.count_documents(count, maxTimeMS=timeout)
-                }]
-                client_time = timeit.default_timer() - t_before
+                t_before = time.perf_counter_ns()
+                order_count = collection.count_documents(count, maxTimeMS=timeout, **hint_parameters)
+                query_results = [{'order_count': order_count}]
+                client_time = (time.perf_counter_ns() - t_before) * 1e-9
+                server_time, fetch_time, parse_time = client_time, 0.0, 0.0
                 status = 'success'
                 query = count
 
             else:  # aggregate is not None
-                t_before = timeit.default_timer()
-                query_results = [
-                    self._format_strict(r) for r in
-                    collection.aggregate(aggregate, allowDiskUse=True, maxTimeMS=timeout)
-                ]
-                client_time = timeit.default_timer() - t_before
+                # Time the first batch, the remaining batches, and our BSON conversion separately.
+                t_send = time.perf_counter_ns()
+                cursor = collection.aggregate(aggregate, allowDiskUse=allow_disk_use, maxTimeMS=timeout,
+                                              batchSize=self.batch_size, **hint_parameters)
+                t_first = time.perf_counter_ns()
+                query_results, parse_time_ns = [], 0
+                if single_result:
+                    # Our pipeline produces (at most) one document, so we do not need to drain the cursor.
+                    cursor_iterable = [r for r in [next(cursor, None)] if r is not None]
+                    cursor.close()
+                else:
+                    cursor_iterable = cursor
+
+                # Convert each document as it arrives, instead of holding both the BSON and converted results.
+                for r in cursor_iterable:
+                    t_parse = time.perf_counter_ns()
+                    query_results.append(self._to_jsonable(r))
+                    parse_time_ns += time.perf_counter_ns() - t_parse
+                t_done = time.perf_counter_ns()
+
+                server_time = (t_first - t_send) * 1e-9
+                fetch_time = (t_done - t_first - parse_time_ns) * 1e-9
+                parse_time = parse_time_ns * 1e-9
+                client_time = (t_done - t_send) * 1e-9
                 status = 'success'
                 query = aggregate
 
@@ -60,7 +97,51 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
             status = 'timeout'
             query = count if count is not None else aggregate
 
-        return {'queryResults': query_results, 'clientTime': client_time, 'status': status, 'query': query}
+        except pymongo.errors.OperationFailure as e:
+            # Queries that run without disk use will fail if they exceed the in-memory limit. Surface these.
+            if e.code != 292 and 'memory limit' not in str(e).lower():
+                raise e
+            self.logger.warning(f'Query has exceeded the in-memory limit (allowDiskUse={allow_disk_use}): {str(e)}')
+            query_results = None
+            client_time = None
+            status = 'memoryLimit'
+            query = count if count is not None else aggregate
+
+        return {'queryResults': query_results, 'clientTime': client_time, 'serverTime': server_time,
+                'fetchTime': fetch_time, 'parseTime': parse_time, 'status': status, 'query': query}
+
+    @staticmethod
+    def delivery_date_match(v0, v1):
+        """ The $elemMatch must precede any $unwind to use the orderlineDelivDateIdx index. """
+        return {'$match': {'o_orderline': {'$elemMatch': {'ol_delivery_d': {'$gte': v0, '$lte': v1}}}}}
+
+    @staticmethod
+    def delivery_date_unwind(v0, v1):
+        """ Unwind each order, keeping only the orderlines that fall within our delivery date range. """
+        return [
+            {'$unwind': {'path': '$o_orderline'}},
+            {'$match': {'o_orderline.ol_delivery_d': {'$gte': v0, '$lte': v1}}}
+        ]
+
+    def execute_faceted(self, name, v0, v1, facets, timeout=None):
+        """ Evaluate several pipelines behind a single delivery date $match, in one round trip. """
+        response_json = self.execute_select(**{
+            'name': name,
+            'count': None,
+            'aggregate': [self.delivery_date_match(v0, v1), {'$facet': facets}],
+            'timeout': timeout,
+            'allow_disk_use': False,
+            'hint': 'orderlineDelivDateIdx',
+            'single_result': True
+        })
+
+        # Demultiplex the single $facet document into the results of each query.
+        faceted_results = {}
+        for facet_name in facets:
+            faceted_results[facet_name] = {**response_json, 'facets': list(facets)}
+            if response_json['queryResults'] is not None:
+                faceted_results[facet_name]['queryResults'] = response_json['queryResults'][0][facet_name]
+        return faceted_results
 
     def query_a_factory(self) -> AbstractBenchmarkQueryRunnable:
         class _QueryARunnable(AbstractBenchmarkQueryRunnable):
@@ -68,27 +149,34 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                 super(_QueryARunnable, self).__init__('A', query_suite.generate_dates)
                 self.query_suite = query_suite
 
+            def facet_stages(self, v0, v1) -> list:
+                return [
+                    {
+                        # Count the qualifying orderlines of each order, instead of unwinding each order.
+                        '$project': {'_id': 0, 'n': {'$size': {'$filter': {
+                            'input': '$o_orderline',
+                            'as': 'ol',
+                            'cond': {'$and': [{'$gte': ['$$ol.ol_delivery_d', v0]},
+                                              {'$lte': ['$$ol.ol_delivery_d', v1]}]}
+                        }}}}
+                    },
+                    {
+                        '$group': {'_id': None, 'count_orders': {'$sum': '$n'}}
+                    },
+                    {
+                        '$project': {'_id': 0, 'count_orders': 1}
+                    }
+                ]
+
             def invoke(self, v0, v1, timeout) -> dict:
                 return self.query_suite.execute_select(**{
                     'name': 'Orders',
                     'count': None,
-                    'aggregate': [
-                        {
-                            '$match': {'o_orderline': {
-                                '$elemMatch': {'ol_delivery_d': {'$gte': v0, '$lte': v1}}}
-                            }
-                        },
-                        {
-                            '$unwind': {'path': '$o_orderline'}
-                        },
-                        {
-                            '$match': {'o_orderline.ol_delivery_d': {'$gte': v0, '$lte': v1}}
-                        },
-                        {
-                            '$count': 'count_orders'
-                        }
-                    ],
-                    'timeout': timeout * 1000
+                    'aggregate': [self.query_suite.delivery_date_match(v0, v1)] + self.facet_stages(v0, v1),
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': False,
+                    'hint': 'orderlineDelivDateIdx',
+                    'single_result': True
                 })
 
         return _QueryARunnable(query_suite=self)
@@ -99,12 +187,20 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                 super(_QueryBRunnable, self).__init__('B', query_suite.generate_dates)
                 self.query_suite = query_suite
 
+            def facet_stages(self, v0, v1) -> list:
+                return [
+                    {
+                        '$count': 'order_count'
+                    }
+                ]
+
             def invoke(self, v0, v1, timeout) -> dict:
                 return self.query_suite.execute_select(**{
                     'name': 'Orders',
                     'count': {'o_orderline': {'$elemMatch': {'ol_delivery_d': {'$gte': v0, '$lte': v1}}}},
                     'aggregate': None,
-                    'timeout': timeout * 1000
+                    'timeout': timeout * 1000,
+                    'hint': 'orderlineDelivDateIdx'
                 })
 
         return _QueryBRunnable(query_suite=self)
@@ -132,7 +228,10 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                             '$count': 'count_orders'
                         }
                     ],
-                    'timeout': timeout * 1000
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': False,
+                    'hint': 'orderlineDelivDateIdx',
+                    'single_result': True
                 })
 
         return _QueryCRunnable(query_suite=self)
@@ -152,22 +251,36 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                             '$match': {'i_id': {'$gte': v0, '$lte': v1}}
                         },
                         {
+                            # Count the matching orderlines inside the join instead of unwinding its output.
                             '$lookup': {'from': 'Orders',
                                         'localField': 'i_id',
                                         'foreignField': 'o_orderline.ol_i_id',
+                                        'let': {'iid': '$i_id'},
+                                        'pipeline': [
+                                            {
+                                                '$project': {'_id': 0, 'n': {'$size': {'$filter': {
+                                                    'input': '$o_orderline',
+                                                    'as': 'ol',
+                                                    'cond': {'$eq': ['$$ol.ol_i_id', '$$iid']}
+                                                }}}}
+                                            },
+                                            {
+                                                '$group': {'_id': None, 'n': {'$sum': '$n'}}
+                                            }
+                                        ],
                                         'as': 'orders'}
                         },
                         {
-                            '$unwind': {'path': '$orders'}
-                        },
-                        {
-                            '$unwind': {'path': '$orders.o_orderline'}
+                            '$group': {'_id': None,
+                                       'count_order_item': {'$sum': {'$sum': '$orders.n'}}}
                         },
                         {
-                            '$count': 'count_order_item'
+                            '$project': {'_id': 0, 'count_order_item': 1}
                         }
                     ],
-                    'timeout': timeout * 1000
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': False,
+                    'single_result': True
                 })
 
         return _QueryDRunnable(query_suite=self)
@@ -178,32 +291,39 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                 super(_Query1Runnable, self).__init__('1', query_suite.generate_dates)
                 self.query_suite = query_suite
 
+            def facet_stages(self, v0, v1) -> list:
+                return [
+                    {
+                        '$project': {
+                            '_id': 0,
+                            'o_orderline.ol_delivery_d': 1,
+                            'o_orderline.ol_number': 1,
+                            'o_orderline.ol_quantity': 1,
+                            'o_orderline.ol_amount': 1
+                        }
+                    },
+                    *self.query_suite.delivery_date_unwind(v0, v1),
+                    {
+                        '$group': {'_id': '$o_orderline.ol_number',
+                                   'sum_qty': {'$sum': '$o_orderline.ol_quantity'},
+                                   'sum_amount': {'$sum': '$o_orderline.ol_amount'},
+                                   'avg_qty': {'$avg': '$o_orderline.ol_quantity'},
+                                   'avg_amount': {'$avg': '$o_orderline.ol_amount'},
+                                   'count_order': {'$sum': 1}}
+                    },
+                    {
+                        '$sort': {'o_orderline.ol_number': 1}
+                    }
+                ]
+
             def invoke(self, v0, v1, timeout) -> dict:
                 return self.query_suite.execute_select(**{
                     'name': 'Orders',
                     'count': None,
-                    'aggregate': [
-                        {
-                            '$match': {'o_orderline': {
-                                '$elemMatch': {'ol_delivery_d': {'$gte': v0, '$lte': v1}}}
-                            }
-                        },
-                        {
-                            '$unwind': {'path': '$o_orderline'}
-                        },
-                        {
-                            '$group': {'_id': '$o_orderline.ol_number',
-                                       'sum_qty': {'$sum': '$o_orderline.ol_quantity'},
-                                       'sum_amount': {'$sum': '$o_orderline.ol_amount'},
-                                       'avg_qty': {'$avg': '$o_orderline.ol_quantity'},
-                                       'avg_amount': {'$avg': '$o_orderline.ol_amount'},
-                                       'count_order': {'$sum': 1}}
-                        },
-                        {
-                            '$sort': {'o_orderline.ol_number': 1}
-                        }
-                    ],
-                    'timeout': timeout * 1000
+                    'aggregate': [self.query_suite.delivery_date_match(v0, v1)] + self.facet_stages(v0, v1),
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': False,
+                    'hint': 'orderlineDelivDateIdx'
                 })
 
         return _Query1Runnable(query_suite=self)
@@ -214,25 +334,44 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                 super(_Query6Runnable, self).__init__('6', query_suite.generate_dates)
                 self.query_suite = query_suite
 
+            def facet_stages(self, v0, v1) -> list:
+                return [
+                    {
+                        '$match': {'o_orderline': {
+                            '$elemMatch': {'ol_delivery_d': {'$gte': v0, '$lte': v1},
+                                           'ol_quantity': {'$gte': 1, '$lte': 100000}}}
+                        }
+                    },
+                    {
+                        '$project': {
+                            '_id': 0,
+                            'o_orderline.ol_delivery_d': 1,
+                            'o_orderline.ol_quantity': 1,
+                            'o_orderline.ol_amount': 1
+                        }
+                    },
+                    {
+                        '$unwind': {'path': '$o_orderline'}
+                    },
+                    {
+                        '$match': {'o_orderline.ol_delivery_d': {'$gte': v0, '$lte': v1},
+                                   'o_orderline.ol_quantity': {'$gte': 1, '$lte': 100000}}
+                    },
+                    {
+                        '$group': {'_id': None,
+                                   'revenue': {'$sum': '$o_orderline.ol_amount'}, }
+                    }
+                ]
+
             def invoke(self, v0, v1, timeout) -> dict:
                 return self.query_suite.execute_select(**{
                     'name': 'Orders',
                     'count': None,
-                    'aggregate': [
-                        {
-                            '$match': {'o_orderline': {
-                                '$elemMatch': {'ol_delivery_d': {'$gte': v0, '$lte': v1}}}
-                            }
-                        },
-                        {
-                            '$match': {'o_orderline.ol_quantity': {'$gte': 1, '$lte': 100000}}
-                        },
-                        {
-                            '$group': {'_id': None,
-                                       'revenue': {'$sum': '$o_orderline.ol_amount'}, }
-                        }
-                    ],
-                    'timeout': timeout * 1000
+                    'aggregate': self.facet_stages(v0, v1),
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': False,
+                    'hint': 'orderlineDelivDateQuantityIdx',
+                    'single_result': True
                 })
 
         return _Query6Runnable(query_suite=self)
@@ -254,8 +393,19 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                             }
                         },
                         {
-                            '$unwind': {'path': '$o_orderline'}
+                            '$project': {
+                                '_id': 0,
+                                'o_orderline.ol_delivery_d': 1,
+                                'o_c_id': 1,
+                                'o_w_id': 1,
+                                'o_d_id': 1,
+                                'o_entry_d': 1,
+                                'o_orderline.ol_i_id': 1,
+                                'o_orderline.ol_supply_w_id': 1,
+                                'o_orderline.ol_amount': 1
+                            }
                         },
+                        *self.query_suite.delivery_date_unwind(v0, v1),
                         {
                             '$lookup': {'from': 'Stock',
                                         'localField': 'o_orderline.ol_i_id',
@@ -348,7 +498,9 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                             '$sort': {'supp_nation': 1, 'cust_nation': 1, 'l_year': 1}
                         }
                     ],
-                    'timeout': timeout * 1000
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': True,
+                    'hint': 'orderlineDelivDateIdx'
                 })
 
         return _Query7Runnable(query_suite=self)
@@ -359,42 +511,47 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                 super(_Query12Runnable, self).__init__('12', query_suite.generate_dates)
                 self.query_suite = query_suite
 
+            def facet_stages(self, v0, v1) -> list:
+                return [
+                    {
+                        '$project': {
+                            '_id': 0,
+                            'o_ol_cnt': 1,
+                            'o_carrier_id': 1,
+                            'o_entry_d': 1,
+                            'o_orderline.ol_delivery_d': 1
+                        }
+                    },
+                    *self.query_suite.delivery_date_unwind(v0, v1),
+                    {
+                        '$project': {
+                            'o_ol_cnt': '$o_ol_cnt',
+                            'is_delivered_after_entry': {'$lte': ['$o_entry_d', '$o_orderline.ol_delivery_d']},
+                            'high_line': {'$cond': [{'$in': ['$o_carrier_id', [1, 2]]}, 1, 0]},
+                            'low_line': {'$cond': [{'$in': ['$o_carrier_id', [1, 2]]}, 0, 1]}
+                        }
+                    },
+                    {
+                        '$match': {'is_delivered_after_entry': True}
+                    },
+                    {
+                        '$group': {'_id': '$o_ol_cnt',
+                                   'high_line_count': {'$sum': '$high_line'},
+                                   'low_line_count': {'$sum': '$low_line'}}
+                    },
+                    {
+                        '$sort': {'_id': 1}
+                    }
+                ]
+
             def invoke(self, v0, v1, timeout) -> dict:
                 return self.query_suite.execute_select(**{
                     'name': 'Orders',
                     'count': None,
-                    'aggregate': [
-                        {
-                            '$match': {'o_orderline': {
-                                '$elemMatch': {'ol_delivery_d': {'$gte': v0, '$lte': v1}}}
-                            }
-                        },
-                        {
-                            '$match': {'$expr': {'$lte': ['$o_entry_d', '$o_orderline.ol_delivery_d']}}
-                        },
-                        {
-                            '$project': {
-                                'o_ol_cnt': '$o_ol_cnt',
-                                'high_line': {
-                                    '$switch': {'branches': [{'case': {'$in': ['$o_carrier_id', [1, 2]]}, 'then': 1}],
-                                                'default': 0}
-                                },
-                                'low_line': {
-                                    '$switch': {'branches': [{'case': {'$in': ['$o_carrier_id', [1, 2]]}, 'then': 0}],
-                                                'default': 1}
-                                }
-                            }
-                        },
-                        {
-                            '$group': {'_id': '$o_ol_cnt',
-                                       'high_line_count': {'$sum': 'high_line'},
-                                       'low_line_count': {'$sum': 'low_line'}}
-                        },
-                        {
-                            '$sort': {'o_ol_cnt': 1}
-                        }
-                    ],
-                    'timeout': timeout * 1000
+                    'aggregate': [self.query_suite.delivery_date_match(v0, v1)] + self.facet_stages(v0, v1),
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': False,
+                    'hint': 'orderlineDelivDateIdx'
                 })
 
         return _Query12Runnable(query_suite=self)
@@ -405,56 +562,67 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                 super(_Query14Runnable, self).__init__('14', query_suite.generate_dates)
                 self.query_suite = query_suite
 
+            def facet_stages(self, v0, v1) -> list:
+                return [
+                    {
+                        '$project': {
+                            '_id': 0,
+                            'o_orderline.ol_delivery_d': 1,
+                            'o_orderline.ol_i_id': 1,
+                            'o_orderline.ol_amount': 1
+                        }
+                    },
+                    *self.query_suite.delivery_date_unwind(v0, v1),
+                    {
+                        # Only promotional items are materialized by the join.
+                        '$lookup': {'from': 'Item',
+                                    'localField': 'o_orderline.ol_i_id',
+                                    'foreignField': 'i_id',
+                                    'pipeline': [
+                                        {
+                                            '$match': {'i_data': {'$regex': '^pr'}}
+                                        },
+                                        {
+                                            '$project': {'_id': 0, 'i_id': 1}
+                                        }
+                                    ],
+                                    'as': 'item'}
+                    },
+                    {
+                        '$project': {
+                            'ol_amount': '$o_orderline.ol_amount',
+                            'ol_amount_pr': {
+                                '$cond': [{'$gt': [{'$size': '$item'}, 0]}, '$o_orderline.ol_amount', 0]
+                            }
+                        }
+                    },
+                    {
+                        '$group': {'_id': None,
+                                   'ol_amount_sum_pr': {'$sum': '$ol_amount_pr'},
+                                   'ol_amount_sum': {'$sum': '$ol_amount'}}
+                    },
+                    {
+                        '$project': {
+                            '_id': 0,
+                            'promo_revenue': {
+                                '$divide': [
+                                    {'$multiply': [100.0, '$ol_amount_sum_pr']},
+                                    {'$add': [1, "$ol_amount_sum"]}
+                                ]
+                            }
+                        }
+                    }
+                ]
+
             def invoke(self, v0, v1, timeout) -> dict:
                 return self.query_suite.execute_select(**{
                     'name': 'Orders',
                     'count': None,
-                    'aggregate': [
-                        {
-                            '$match': {'o_orderline': {
-                                '$elemMatch': {'ol_delivery_d': {'$gte': v0, '$lte': v1}}}
-                            }
-                        },
-                        {
-                            '$unwind': {'path': '$o_orderline'}
-                        },
-                        {
-                            '$lookup': {'from': 'Item',
-                                        'localField': 'o_orderline.ol_i_id',
-                                        'foreignField': 'i_id',
-                                        'as': 'item'}
-                        },
-                        {
-                            '$project': {
-                                'ol_amount_pr': {
-                                    '$switch': {
-                                        'branches': [{
-                                            'case': {'$regexMatch': {'input': {'$first': '$item.i_data'},
-                                                                     'regex': '/^pr/'}},
-                                            'then': '$o_orderline.ol_amount'
-                                        }],
-                                        'default': 0
-                                    }
-                                }
-                            }
-                        },
-                        {
-                            '$group': {'_id': None,
-                                       'ol_amount_sum_pr': {'$sum': '$ol_amount_pr'},
-                                       'ol_amount_sum': {'$sum': '$o_orderline.ol_amount'}}
-                        },
-                        {
-                            '$project': {
-                                'promo_revenue': {
-                                    '$divide': [
-                                        {'$multiply': [100.0, '$ol_amount_pr']},
-                                        {'$add': [1, "$ol_amount_sum"]}
-                                    ]
-                                }
-                            }
-                        }
-                    ],
-                    'timeout': timeout * 1000
+                    'aggregate': [self.query_suite.delivery_date_match(v0, v1)] + self.facet_stages(v0, v1),
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': False,
+                    'hint': 'orderlineDelivDateIdx',
+                    'single_result': True
                 })
 
         return _Query14Runnable(query_suite=self)
@@ -476,8 +644,15 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                             }
                         },
                         {
-                            '$unwind': {'path': '$o_orderline'}
+                            '$project': {
+                                '_id': 0,
+                                'o_orderline.ol_delivery_d': 1,
+                                'o_orderline.ol_i_id': 1,
+                                'o_orderline.ol_supply_w_id': 1,
+                                'o_orderline.ol_amount': 1
+                            }
                         },
+                        *self.query_suite.delivery_date_unwind(v0, v1),
                         {
                             '$lookup': {'from': 'Stock',
                                         'localField': 'o_orderline.ol_i_id',
@@ -502,6 +677,14 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                             '$group': {'_id': '$supplier_no',
                                        'total_revenue': {'$sum': '$ol_amount'}}
                         },
+                        {
+                            # Rank suppliers by revenue, keeping only the top supplier(s) before joining.
+                            '$setWindowFields': {'sortBy': {'total_revenue': -1},
+                                                 'output': {'revenue_rank': {'$denseRank': {}}}}
+                        },
+                        {
+                            '$match': {'revenue_rank': 1}
+                        },
                         {
                             '$lookup': {'from': 'Supplier',
                                         'localField': '_id',
@@ -511,33 +694,23 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                         {
                             '$unwind': {'path': '$supplier'}
                         },
-                        {
-                            '$group': {'_id': None,
-                                       'data': {'$push': '$$ROOT'},
-                                       'max_revenue': {'$max': '$total_revenue'}}
-                        },
-                        {
-                            '$unwind': '$data'
-                        },
-                        {
-                            '$match': {'$expr': {
-                                '$eq': ['$data.total_revenue', '$max_revenue']
-                            }}
-                        },
                         {
                             '$project': {
-                                'su_suppkey': '$data.supplier.su_suppkey',
-                                'su_name': '$data.supplier.su_name',
-                                'su_address': '$data.supplier.su_address',
-                                'su_phone': '$data.supplier.su_phone',
-                                'total_revenue': '$data.total_revenue'
+                                '_id': 0,
+                                'su_suppkey': '$supplier.su_suppkey',
+                                'su_name': '$supplier.su_name',
+                                'su_address': '$supplier.su_address',
+                                'su_phone': '$supplier.su_phone',
+                                'total_revenue': '$total_revenue'
                             }
                         },
                         {
                             '$sort': {'su_suppkey': 1}
                         }
                     ],
-                    'timeout': timeout * 1000
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': True,
+                    'hint': 'orderlineDelivDateIdx'
                 })
 
         return _Query15Runnable(query_suite=self)
@@ -559,8 +732,14 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                             }
                         },
                         {
-                            '$unwind': {'path': '$o_orderline'}
+                            '$project': {
+                                '_id': 0,
+                                'o_orderline.ol_delivery_d': 1,
+                                'o_orderline.ol_i_id': 1,
+                                'o_orderline.ol_quantity': 1
+                            }
                         },
+                        *self.query_suite.delivery_date_unwind(v0, v1),
                         {
                             '$lookup': {'from': 'Stock',
                                         'localField': 'o_orderline.ol_i_id',
@@ -629,7 +808,9 @@ class MongoDBBenchmarkQuerySuite(AbstractBenchmarkQuerySuite):
                             '$sort': {'su_name': 1}
                         }
                     ],
-                    'timeout': timeout * 1000
+                    'timeout': timeout * 1000,
+                    'allow_disk_use': True,
+                    'hint': 'orderlineDelivDateIdx'
                 })
 
         return _Query20Runnable(query_suite=self)
@@ -668,38 +849,106 @@ class MongoDBBenchmarkRunnable(AbstractBenchmarkRunnable):
                             f'{urllib.parse.quote_plus(self.config["password"])}@' \
                             f'{self.config["database"]["address"]}' + \
                             f':{self.config["database"]["port"]}'
-        self.database_factory = lambda: pymongo.MongoClient(self.database_uri)[self.config['database']['name']]
-        self.exclude_set = set()
+        self.client = pymongo.MongoClient(self.database_uri, **self.config['client'])
+        self.database = self.client[self.config['database']['name']]
+
+        # Our queries hint at the orderline delivery date indexes, so ensure that these exist.
+        self.logger.info('Ensuring that the orderline delivery date indexes exist.')
+        orders_collection = self.database['Orders']
+        orders_collection.create_index([('o_orderline.ol_delivery_d', pymongo.ASCENDING)],
+                                       name='orderlineDelivDateIdx')
+        orders_collection.create_index([('o_orderline.ol_delivery_d', pymongo.ASCENDING),
+                                        ('o_orderline.ol_quantity', pymongo.ASCENDING)],
+                                       name='orderlineDelivDateQuantityIdx')
+
+        # Our query runnables do not depend on sigma, so we only need to build them (and their names) once.
+        self.queries = [(query, str(query)) for query in MongoDBBenchmarkQuerySuite(
+            database=self.database,
+            batch_size=self.config['batchSize'],
+            logger=self.logger,
+            sigma_values=self.config['experiment']['sigmaValues'],
+            **self.config['tpcCH']
+        )]
+
+    def _perform_faceted(self, i, sigma, queries):
+        queries = [(q, n) for q, n in queries if sigma < self.min_excluded_sigma.get(n, math.inf)]
+        if len(queries) == 0:
+            return
+
+        # All queries in our group share the same value range, drawn from the generator of the first query.
+        query_suite = queries[0][0].query_suite
+        v0, v1 = queries[0][0].query_runnable.generator(sigma)
+        facets = {n: q.query_runnable.facet_stages(v0, v1) for q, n in queries}
+
+        # Execute the queries as a single aggregate. Record the client response time for the entire group.
+        self.logger.info('Executing queries %s as one $facet with sigma %s @ run %d.', list(facets), sigma, i + 1)
+        t_before = time.perf_counter_ns()
+        faceted_results = query_suite.execute_faceted('Orders', v0, v1, facets,
+                                                      timeout=self.config['experiment']['timeout'] * 1000)
+        client_time = (time.perf_counter_ns() - t_before) * 1e-9
+
+        for query, query_name in queries:
+            results = faceted_results[query_name]
+            results['generator'] = str(query.query_runnable.generator)
+            results['valueRange'] = {'v0': v0, 'v1': v1}
+            results['sigma'] = sigma
+            results['query'] = query_name
+            results['clientTime'] = client_time
+            results['runNumber'] = i
+            self.log_results(results)
+
+        # If this group was not successful, exclude every query in the group.
+        if any(faceted_results[n]['status'] != 'success' for _, n in queries):
+            self.logger.warning('Queries were not successful. No longer running (>= sigma) + queries.')
+            for _, query_name in queries:
+                self.min_excluded_sigma[query_name] = min(sigma, self.min_excluded_sigma.get(query_name, math.inf))
+            self.logger.info('Restarting the MongoDB instance.')
+            self.call_subprocess(self.config['restartCommand'])
+
+    def _perform_benchmark_serial(self):
+        queries, faceted_queries = self.queries, []
+        if self.config['facetQueries']:
+            faceted_queries = [(q, n) for q, n in queries if hasattr(q.query_runnable, 'facet_stages')]
+            queries = [(q, n) for q, n in queries if not hasattr(q.query_runnable, 'facet_stages')]
 
-    def perform_benchmark(self):
         for i in range(self.config['experiment']['repeat']):
             for sigma in self.config['experiment']['sigmaValues']:
-                for query in MongoDBBenchmarkQuerySuite(
-                    database_factory=self.database_factory,
-                    logger=self.logger,
-                    **self.config['tpcCH']
-                ):
-                    # Check if these current parameters exist in the exclude set.
-                    if (sigma, str(query),) in self.exclude_set:
+                self._perform_faceted(i, sigma, faceted_queries)
+                for query, query_name in queries:
+                    # Check if this query has already failed at this sigma (or at a smaller sigma).
+                    if sigma >= self.min_excluded_sigma.get(query_name, math.inf):
                         continue
 
                     # Execute the query. Record the client response time.
-                    self.logger.info(f'Executing query {query} with sigma {sigma} @ run {i + 1}.')
-                    t_before = timeit.default_timer()
+                    self.logger.info('Executing query %s with sigma %s @ run %d.', query_name, sigma, i + 1)
+                    t_before = time.perf_counter_ns()
                     results = query(sigma=sigma, timeout=self.config['experiment']['timeout'])
-                    results['clientTime'] = timeit.default_timer() - t_before
+                    results['clientTime'] = (time.perf_counter_ns() - t_before) * 1e-9
                     results['runNumber'] = i
                     self.log_results(results)
 
-                    # If this query was not successful, add the query + parameter to the exclude set.
+                    # If this query was not successful, exclude this query for all sigma >= this sigma.
                     if results['status'] != 'success':
                         self.logger.warning('Query was not successful. No longer running (>= sigma) + query.')
-                        for excluded_sigma in self.config['experiment']['sigmaValues']:
-                            if excluded_sigma >= sigma:
-                                self.exclude_set.add((excluded_sigma, str(query),))
+                        self.min_excluded_sigma[query_name] = \
+                            min(sigma, self.min_excluded_sigma.get(query_name, math.inf))
                         self.logger.info('Restarting the MongoDB instance.')
                         self.call_subprocess(self.config['restartCommand'])
 
+    def perform_benchmark(self):
+        # By default, we execute each query in isolation. Otherwise, overlap up to N queries at a time.
+        if self.config['concurrency'] > 1 and self.config['facetQueries']:
+            raise ValueError('Faceted queries can only be executed serially (concurrency = 1).')
+        elif self.config['concurrency'] > 1:
+            self.logger.info('Executing up to %d queries concurrently.', self.config['concurrency'])
+            self.perform_benchmark_concurrent()
+        else:
+            self._perform_benchmark_serial()
+
+    def perform_post(self):
+        self.logger.info('Closing the MongoDB client.')
+        self.client.close()
+
 
 if __name__ == '__main__':
     MongoDBBenchmarkRunnable().invoke()
@@ -1,12 +1,23 @@
 import logging.config
+import logging.handlers
+import concurrent.futures
 import datetime
 import logging
+import math
+import queue
+import threading
+import time
 import uuid
 import os
 import subprocess
 import abc
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class AbstractBenchmarkRunnable(abc.ABC):
     def call_subprocess(self, command, is_log=True):
@@ -18,15 +29,16 @@ class AbstractBenchmarkRunnable(abc.ABC):
             universal_newlines=True
         )
 
-        resultant = ''
-        for stdout_line in iter(subprocess_pipe.stdout.readline, ""):
+        # Log each (non-empty) line as it arrives, exactly once. Skip this entirely if no one is listening.
+        is_log = is_log and self.logger.isEnabledFor(logging.DEBUG)
+        resultant_lines = []
+        for stdout_line in subprocess_pipe.stdout:
             if stdout_line.strip() != '':
-                resultant += stdout_line
-                for line in resultant.strip().split('\n'):
-                    if is_log:
-                        self.logger.debug(line)
+                resultant_lines.append(stdout_line)
+                if is_log:
+                    self.logger.debug(stdout_line.rstrip())
         subprocess_pipe.stdout.close()
-        return resultant
+        return ''.join(resultant_lines)
 
     def __init__(self, **kwargs):
         # Create our results directory if it does not already exist.
@@ -37,38 +49,81 @@ class AbstractBenchmarkRunnable(abc.ABC):
         self.logger.setLevel(logging.DEBUG)
         formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 
-        # We will log to the console and to a file.
+        # We will log to the console and to a file. Records are formatted here, but written from a background thread.
         fh = logging.FileHandler(f"{kwargs['resultsDir']}/aconitum.log")
         fh.setLevel(logging.DEBUG)
         ch = logging.StreamHandler()
         ch.setLevel(logging.INFO)
         fh.setFormatter(formatter)
         ch.setFormatter(formatter)
-        self.logger.addHandler(fh)
-        self.logger.addHandler(ch)
+        log_queue = queue.SimpleQueue()
+        self.log_listener = logging.handlers.QueueListener(log_queue, fh, ch, respect_handler_level=True)
+        self.log_listener.start()
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
-        # Results will be recorded to a separate file (in lines-JSON format).
-        self.results_fp = open(kwargs['resultsDir'] + '/' + 'results.json', 'w')
+        # Results will be recorded to a separate file (in lines-JSON format). Writes are buffered until we close.
+        self.results_fp = open(kwargs['resultsDir'] + '/' + 'results.json', 'wb', buffering=1 << 20)
 
         self.logger.info(f'Using the following configuration: {kwargs}')
         self.working_system = kwargs['workingSystem']
         self.execution_id = str(uuid.uuid4())
         self.config = kwargs
 
+        # Queries that fail at some sigma are no longer run at that sigma (or larger). Workers share this map.
+        self.min_excluded_sigma = {}
+        self.exclude_lock = threading.Lock()
+
     def log_results(self, results):
         results['logTime'] = str(datetime.datetime.now())
         results['executionID'] = self.execution_id
         results['workingSystem'] = self.working_system
         results['runtimeNotes'] = self.config['runtimeNotes']
 
-        # To the results file.
+        # To the results file. We do not echo each result to the console (it is already on disk).
         self.logger.debug('Recording result to disk.')
-        json.dump(results, self.results_fp)
-        self.results_fp.write('\n')
-
-        # To the console.
-        self.logger.debug('Writing result to console.')
-        self.logger.debug(json.dumps(results))
+        if orjson is not None:
+            results_blob = orjson.dumps(results, default=str)
+        else:
+            results_blob = json.dumps(results, default=str).encode('utf-8')
+        self.results_fp.write(results_blob + b'\n')
+
+    def _perform_one_concurrent(self, i, sigma, query, query_name):
+        # Check if this query has already failed at this sigma or smaller (another worker may have failed).
+        if sigma >= self.min_excluded_sigma.get(query_name, math.inf):
+            return None
+
+        # Execute the query. Record the client response time.
+        self.logger.info('Executing query %s with sigma %s @ run %d.', query_name, sigma, i + 1)
+        t_before = time.perf_counter_ns()
+        results = query(sigma=sigma, timeout=self.config['experiment']['timeout'])
+        results['clientTime'] = (time.perf_counter_ns() - t_before) * 1e-9
+        results['runNumber'] = i
+
+        # We cannot restart the instance while other queries are in flight, so we only exclude here.
+        if results['status'] != 'success':
+            self.logger.warning('Query was not successful. No longer running (>= sigma) + query.')
+            with self.exclude_lock:
+                self.min_excluded_sigma[query_name] = min(sigma, self.min_excluded_sigma.get(query_name, math.inf))
+        return results
+
+    def perform_benchmark_concurrent(self):
+        """ Run every (run, sigma, query) of self.queries on up to N worker threads, N given by our concurrency. """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.config['concurrency']) as executor:
+            futures = []
+            for i in range(self.config['experiment']['repeat']):
+                for sigma in self.config['experiment']['sigmaValues']:
+                    for query, query_name in self.queries:
+                        futures.append(executor.submit(self._perform_one_concurrent, i, sigma, query, query_name))
+
+            # Results are only ever written to disk from this thread.
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    self.logger.error('Exception caught while executing query: %s', e)
+                    continue
+                if results is not None:
+                    self.log_results(results)
 
     @abc.abstractmethod
     def perform_benchmark(self):
@@ -80,14 +135,16 @@ class AbstractBenchmarkRunnable(abc.ABC):
     def invoke(self):
         self.logger.info(f'Working with execution id: {self.execution_id}.')
 
-        # Perform the benchmark.
-        self.logger.info('Executing the benchmark.')
-        self.perform_benchmark()
+        try:
+            # Perform the benchmark.
+            self.logger.info('Executing the benchmark.')
+            self.perform_benchmark()
 
-        # Perform any post action.
-        self.logger.info('Flushing the logger.')
-        [h.flush() for h in self.logger.handlers]
+            # Perform any post action.
+            self.perform_post()
+            self.logger.info('Benchmark has finished executing.')
 
-        self.perform_post()
-        self.results_fp.close()
-        self.logger.info('Benchmark has finished executing.')
+        finally:
+            # Write out any results and log records that are still buffered (even if we were aborted).
+            self.results_fp.close()
+            self.log_listener.stop()
@@ -2,7 +2,6 @@ import datetime
 import abc
 import random
 import math
-import faker
 import natsort
 
 from dateutil import relativedelta
@@ -21,25 +20,65 @@ class AbstractBenchmarkQueryRunnable(abc.ABC):
         pass
 
 
-class AbstractBenchmarkQuerySuite(abc.ABC):
-    def generate_dates(self, sigma):
-        """ Generate a random range between the start and end order dates. """
-        benchmark_run_date = datetime.datetime.strptime(self.config['runDate'], '%Y-%m-%d %H:%M:%S')
-        benchmark_start_date = benchmark_run_date - relativedelta.relativedelta(years=7)
-        benchmark_end_date = benchmark_run_date - relativedelta.relativedelta(days=1)
+class QueryRunnableAcceptingSigma:
+    """ Wraps a query runnable, generating its value range from a selectivity value on each call. """
+    __slots__ = ('query_runnable', 'query_suite')
 
-        # Determine the desired delta using the given sigma.
-        desired_delta = (sigma / 100.0) * (benchmark_end_date - benchmark_start_date)
+    def __init__(self, query_suite, query_runnable):
+        self.query_runnable = query_runnable
+        self.query_suite = query_suite
+
+    def __str__(self):
+        return self.query_runnable.__str__()
+
+    def __call__(self, sigma, timeout):
+        v0, v1 = self.query_runnable.generator(sigma)
+        results = self.query_runnable.invoke(v0=v0, v1=v1, timeout=timeout)
+        results['generator'] = str(self.query_runnable.generator)
+        results['valueRange'] = {'v0': v0, 'v1': v1}
+        results['sigma'] = sigma
+        results['query'] = str(self)
+        return results
 
-        # Generate the range. Ensure that the generated end date does not go past the benchmark end date.
-        generated_start_date, generated_end_date = benchmark_start_date, benchmark_end_date
-        while generated_end_date >= benchmark_end_date:
-            generated_start_date = self.faker.date_time_between(
-                start_date=benchmark_start_date, end_date=benchmark_end_date)
-            generated_end_date = generated_start_date + desired_delta
 
-        self.logger.debug(f'Generated dates: [{generated_start_date}, {generated_end_date}]')
-        return generated_start_date.strftime('%Y-%m-%d %H:%M:%S'), generated_end_date.strftime('%Y-%m-%d %H:%M:%S')
+class AbstractBenchmarkQuerySuite(abc.ABC):
+    __slots__ = ('config', 'factory_list', 'runnable_cache', 'logger', 'benchmark_start_date', 'benchmark_end_date',
+                 'benchmark_date_span_seconds', 'date_rounding_seconds', 'date_bucket_size', 'date_buckets')
+
+    def generate_dates(self, sigma):
+        """ Generate a random range between the start and end order dates, or pick one from this sigma's bucket. """
+        if self.date_bucket_size > 0:
+            # Our buckets are built for the configured sigma values. Any other sigma gets its bucket on first use.
+            if sigma not in self.date_buckets:
+                self.date_buckets[sigma] = [self.draw_dates(sigma) for _ in range(self.date_bucket_size)]
+            return random.choice(self.date_buckets[sigma])
+        else:
+            return self.draw_dates(sigma)
+
+    def draw_dates(self, sigma):
+        """ Draw a new random range between the start and end order dates. """
+        # Determine the desired delta (in whole seconds) using the given sigma. At a granularity of one second, we
+        # truncate (as the strftime of our end date always has). Otherwise, round up so that any positive sigma covers
+        # at least one step.
+        rounding_seconds = self.date_rounding_seconds
+        desired_delta_seconds = (sigma / 100.0) * self.benchmark_date_span_seconds
+        if rounding_seconds == 1:
+            desired_delta_seconds = int(desired_delta_seconds)
+        else:
+            desired_delta_seconds = math.ceil(desired_delta_seconds / rounding_seconds) * rounding_seconds
+        desired_delta_seconds = min(self.benchmark_date_span_seconds, desired_delta_seconds)
+
+        # Generate the range. Only draw start dates whose end date falls before the benchmark end date, and round
+        # the start date down to our granularity.
+        max_offset_seconds = max(0, self.benchmark_date_span_seconds - desired_delta_seconds - 1)
+        offset_seconds = random.randint(0, max_offset_seconds)
+        offset_seconds -= offset_seconds % rounding_seconds
+        generated_start_date = self.benchmark_start_date + datetime.timedelta(seconds=offset_seconds)
+        generated_end_date = generated_start_date + datetime.timedelta(seconds=desired_delta_seconds)
+
+        # Our dates are in whole seconds, so isoformat gives the same string as '%Y-%m-%d %H:%M:%S' (but faster).
+        self.logger.debug('Generated dates: [%s, %s]', generated_start_date, generated_end_date)
+        return generated_start_date.isoformat(' ', 'seconds'), generated_end_date.isoformat(' ', 'seconds')
 
     def generate_items(self, sigma):
         """ Generate a random range between the start and end item IDs. """
@@ -53,56 +92,51 @@ class AbstractBenchmarkQuerySuite(abc.ABC):
         generated_start_id = random.randint(benchmark_start_id, math.ceil(benchmark_end_id - desired_delta))
         generated_end_id = math.ceil(generated_start_id + desired_delta)
 
-        self.logger.debug(f'Generated item IDs: [{generated_start_id}, {generated_end_id}]')
+        self.logger.debug('Generated item IDs: [%s, %s]', generated_start_id, generated_end_id)
         return generated_start_id, generated_end_id
 
+    def __init_subclass__(cls, **kwargs):
+        """ Record the (query, factory name) pairs of each suite in natural query order, once per class. """
+        super().__init_subclass__(**kwargs)
+        all_queries_set = set([(m.replace('query_', '').replace('_factory', '').capitalize(), m)
+                               for m in dir(AbstractBenchmarkQuerySuite) if m.startswith('query')])
+        cls.factory_names = natsort.natsorted(all_queries_set, key=lambda a: a[0])
+
     def __init__(self, **kwargs):
         self.config = kwargs
-        self.faker = faker.Faker()
-        self.factory_pointer = 0
         self.logger = kwargs['logger']
 
+        # Our benchmark date boundaries are fixed for the entire run, so we only compute these once.
+        benchmark_run_date = datetime.datetime.fromisoformat(kwargs['runDate'])
+        self.benchmark_start_date = benchmark_run_date - relativedelta.relativedelta(years=7)
+        self.benchmark_end_date = benchmark_run_date - datetime.timedelta(days=1)
+        self.benchmark_date_span_seconds = int((self.benchmark_end_date - self.benchmark_start_date).total_seconds())
+
+        # Generated dates can be snapped to coarser boundaries, so that repeated draws share their parameters.
+        self.date_rounding_seconds = kwargs['dateRoundingSeconds']
+        if self.date_rounding_seconds < 1:
+            raise ValueError('dateRoundingSeconds must be at least 1.')
+
+        # Generated dates can also be drawn from a fixed set of ranges per sigma. We build these up front, so that
+        # drawing them is never part of a timed query.
+        self.date_bucket_size = kwargs['dateBucketSize']
+        self.date_buckets = {}
+        if self.date_bucket_size > 0:
+            for sigma in kwargs['sigma_values']:
+                self.date_buckets[sigma] = [self.draw_dates(sigma) for _ in range(self.date_bucket_size)]
+
         exclude_queries_set = set([q.capitalize() for q in kwargs['excludeQueries']])
-        all_queries_set = set([(m.replace('query_', '').replace('_factory', '').capitalize(), m)
-                               for m in dir(AbstractBenchmarkQuerySuite) if m.startswith('query')])
-        for query, factory_name in natsort.natsorted(all_queries_set, key=lambda a: a[0]):
-            if query not in exclude_queries_set:
-                if hasattr(self, 'factory_list'):
-                    self.factory_list.append(getattr(self, factory_name))
-                else:
-                    self.factory_list = [getattr(self, factory_name)]
+        self.factory_list = [getattr(self, factory_name) for query, factory_name in self.factory_names
+                             if query not in exclude_queries_set]
+        self.runnable_cache = [None] * len(self.factory_list)
 
     def __iter__(self):
-        return self
-
-    def __next__(self):
-        try:
-            # Determine our working factory. If this fails, then we have exhausted all queries in our suite.
-            working_factory = self.factory_list[self.factory_pointer]
-            self.factory_pointer += 1
-
-            # Generate the runnable that accepts a selectivity value for use with our queries.
-            class QueryRunnableAcceptingSigma:
-                def __init__(self, query_suite):
-                    self.query_runnable = working_factory()
-                    self.query_suite = query_suite
-
-                def __str__(self):
-                    return self.query_runnable.__str__()
-
-                def __call__(self, *args, **kwargs):
-                    v0, v1 = self.query_runnable.generator(kwargs['sigma'])
-                    results = self.query_runnable.invoke(v0=v0, v1=v1, timeout=kwargs['timeout'])
-                    results['generator'] = str(self.query_runnable.generator)
-                    results['valueRange'] = {'v0': v0, 'v1': v1}
-                    results['sigma'] = kwargs['sigma']
-                    results['query'] = str(self)
-                    return results
-
-            return QueryRunnableAcceptingSigma(query_suite=self)
-
-        except IndexError:
-            raise StopIteration
+        # Each iteration walks the suite from the first query, so a single suite can be reused across runs.
+        for i, working_factory in enumerate(self.factory_list):
+            # Generate the runnable that accepts a selectivity value for use with our queries. We only build this once.
+            if self.runnable_cache[i] is None:
+                self.runnable_cache[i] = QueryRunnableAcceptingSigma(query_suite=self, query_runnable=working_factory())
+            yield self.runnable_cache[i]
 
     @abc.abstractmethod
     def query_a_factory(self) -> AbstractBenchmarkQueryRunnable: